@@ -1,8 +1,17 @@
 from __future__ import annotations
 
+import json
+import os
+import tempfile
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Sequence
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+# Bump quando cambia il formato/contenuto della cache su disco.
+_CACHE_VERSION = 1
+_CACHE_ARRAYS = ("X", "y", "player_ids", "dates")
 
 
 def _require_pandas():
@@ -20,14 +29,14 @@ def _require_pandas():
 def _require_torch():
     try:
         import torch  # type: ignore
-        from torch.utils.data import Dataset  # type: ignore
+        from torch.utils.data import TensorDataset  # type: ignore
     except ImportError as exc:  # pragma: no cover
         raise SystemExit(
             "Dipendenza mancante: torch (PyTorch).\n"
             "Installa con: pip install torch\n"
             f"Dettagli: {exc}"
         ) from exc
-    return torch, Dataset
+    return torch, TensorDataset
 
 
 @dataclass(frozen=True)
@@ -38,6 +47,7 @@ class InjuryDatasetSpec:
     date_col: str = "date"
     label_col: str | None = None
     drop_cols: tuple[str, ...] = ()
+    cache: bool = True
 
 
 def infer_label_col(columns: Iterable[str], *, horizon_days: int) -> str:
@@ -62,7 +72,126 @@ def infer_label_col(columns: Iterable[str], *, horizon_days: int) -> str:
     )
 
 
-class InjuryWithinHDaysDataset:  # torch.utils.data.Dataset (definito runtime)
+def _cache_dir(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.name + ".cache")
+
+
+def _cache_key(csv_path: Path, spec: InjuryDatasetSpec) -> dict[str, Any]:
+    st = csv_path.stat()
+    return {
+        "version": _CACHE_VERSION,
+        "csv_mtime_ns": int(st.st_mtime_ns),
+        "csv_size": int(st.st_size),
+        "horizon_days": int(spec.horizon_days),
+        "id_col": spec.id_col,
+        "date_col": spec.date_col,
+        "label_col": spec.label_col,
+        "drop_cols": sorted(str(c) for c in spec.drop_cols),
+    }
+
+
+def _load_cache(cache_dir: Path, key: dict[str, Any]):
+    """
+    Ritorna (meta, arrays) se la cache è valida per key, altrimenti None.
+    Gli array sono memory-mapped copy-on-write: le pagine vengono lette solo quando servono.
+    """
+    try:
+        meta = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("key") != key:
+        return None
+
+    try:
+        arrays = {
+            name: np.load(cache_dir / f"{name}.npy", mmap_mode="c", allow_pickle=False)
+            for name in _CACHE_ARRAYS
+        }
+    except (OSError, ValueError):
+        return None
+    return meta, arrays
+
+
+def _replace_file(path: Path, write) -> None:
+    # Scrive su un temporaneo nella stessa cartella e lo sostituisce con os.replace: chi ha già mappato
+    # il vecchio file continua a leggere il suo inode, senza vederlo cambiare o troncarsi sotto i piedi.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _save_cache(cache_dir: Path, key: dict[str, Any], meta: dict[str, Any], arrays: dict[str, np.ndarray]) -> None:
+    # Best-effort: se la cartella non è scrivibile si continua senza cache.
+    meta_path = cache_dir / "meta.json"
+    try:
+        cache_dir.mkdir(exist_ok=True)
+        meta_path.unlink(missing_ok=True)  # meta.json scritto per ultimo fa da marker di cache completa
+        for name in _CACHE_ARRAYS:
+            _replace_file(cache_dir / f"{name}.npy", lambda f: np.save(f, arrays[name], allow_pickle=False))
+        payload = json.dumps({"key": key, **meta}).encode("utf-8")
+        _replace_file(meta_path, lambda f: f.write(payload))
+    except OSError:
+        pass
+
+
+def _read_csv_arrays(csv_path: Path, spec: InjuryDatasetSpec):
+    pd = _require_pandas()
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+
+    missing = {c for c in [spec.id_col, spec.date_col] if c not in header}
+    if missing:
+        raise ValueError(f"CSV senza colonne richieste: {sorted(missing)} ({csv_path})")
+
+    label_col = spec.label_col or infer_label_col(header, horizon_days=int(spec.horizon_days))
+    if label_col not in header:
+        raise ValueError(f"CSV senza label_col={label_col!r} ({csv_path})")
+
+    drop_cols = {spec.id_col, spec.date_col, label_col, *(str(c) for c in spec.drop_cols)}
+    feature_cols = [c for c in header if c not in drop_cols]
+    if not feature_cols:
+        raise ValueError("Nessuna feature trovata dopo drop_cols.")
+
+    # Tipi noti dall'header: il parser C emette direttamente float32, senza colonne object intermedie.
+    dtype: dict[str, Any] = {c: np.float32 for c in feature_cols}
+    dtype[label_col] = np.float32
+    dtype[spec.id_col] = str
+    try:
+        df = pd.read_csv(csv_path, dtype=dtype, engine="c")
+    except ValueError as exc:
+        raise ValueError(f"CSV con valori non numerici nelle feature o in {label_col!r} ({csv_path}): {exc}") from exc
+
+    # unica copia C-contiguous (float32) riusata sia per il check NaN sia per X
+    X = np.array(df[feature_cols].to_numpy(), dtype=np.float32, order="C")
+    nan_cols = np.isnan(X).any(axis=0)
+    if nan_cols.any():
+        bad = sorted(str(feature_cols[i]) for i in np.flatnonzero(nan_cols))
+        raise ValueError(f"Feature con NaN dopo conversione numerica: {bad[:10]}{'...' if len(bad) > 10 else ''}")
+
+    y = df[label_col]
+    if y.isna().any():
+        raise ValueError(f"Label contiene valori non numerici/NaN in {label_col!r}.")
+
+    dates = pd.to_datetime(df[spec.date_col], errors="coerce").dt.normalize().to_numpy()
+    if pd.isna(dates).any():
+        raise ValueError(f"Date non parsabili nella colonna {spec.date_col!r}.")
+
+    meta = {"label_col": str(label_col), "feature_names": [str(c) for c in feature_cols]}
+    arrays = {
+        "X": X,
+        "y": y.to_numpy(dtype=np.float32, copy=True),
+        "player_ids": df[spec.id_col].astype(str).to_numpy(dtype=str),
+        "dates": dates,
+    }
+    return meta, arrays
+
+
+class InjuryWithinHDaysDataset:  # wrapper di torch.utils.data.TensorDataset (creato runtime)
     """
     Dataset per classificazione binaria: infortunio entro H giorni (0/1).
 
@@ -71,11 +200,13 @@ class InjuryWithinHDaysDataset:  # torch.utils.data.Dataset (definito runtime)
     - date
     - colonne feature numeriche
     - label: injury_next_{H}_days (o label_col esplicito)
+
+    Con spec.cache=True gli array parsati vengono salvati in `<csv>.cache/` (file .npy + meta.json)
+    e ricaricati via memory-map finché il CSV (mtime/size) e la spec non cambiano.
     """
 
     def __init__(self, spec: InjuryDatasetSpec):
-        pd = _require_pandas()
-        torch, Dataset = _require_torch()
+        torch, TensorDataset = _require_torch()
 
         if int(spec.horizon_days) <= 0:
             raise ValueError("horizon_days deve essere > 0")
@@ -84,53 +215,28 @@ class InjuryWithinHDaysDataset:  # torch.utils.data.Dataset (definito runtime)
         if not csv_path.exists():
             raise FileNotFoundError(f"CSV non trovato: {csv_path}")
 
-        df = pd.read_csv(csv_path)
-
-        missing = {c for c in [spec.id_col, spec.date_col] if c not in df.columns}
-        if missing:
-            raise ValueError(f"CSV senza colonne richieste: {sorted(missing)} ({csv_path})")
-
-        label_col = spec.label_col or infer_label_col(df.columns, horizon_days=int(spec.horizon_days))
-        if label_col not in df.columns:
-            raise ValueError(f"CSV senza label_col={label_col!r} ({csv_path})")
-
-        drop_cols = {spec.id_col, spec.date_col, label_col, *(str(c) for c in spec.drop_cols)}
-        feature_cols = [c for c in df.columns if c not in drop_cols]
-        if not feature_cols:
-            raise ValueError("Nessuna feature trovata dopo drop_cols.")
-
-        for c in feature_cols:
-            df[c] = pd.to_numeric(df[c], errors="coerce")
-
-        if df[feature_cols].isna().any().any():
-            bad = sorted([c for c in feature_cols if df[c].isna().any()])
-            raise ValueError(f"Feature con NaN dopo conversione numerica: {bad[:10]}{'...' if len(bad) > 10 else ''}")
-
-        y = pd.to_numeric(df[label_col], errors="coerce")
-        if y.isna().any():
-            raise ValueError(f"Label contiene valori non numerici/NaN in {label_col!r}.")
+        cache_dir = _cache_dir(csv_path)
+        key = _cache_key(csv_path, spec)
+        cached = _load_cache(cache_dir, key) if spec.cache else None
+        if cached is not None:
+            meta, arrays = cached
+        else:
+            meta, arrays = _read_csv_arrays(csv_path, spec)
+            if spec.cache:
+                _save_cache(cache_dir, key, meta, arrays)
 
         self.spec = spec
         self.csv_path = csv_path
-        self.label_col = label_col
-        self.feature_names = [str(c) for c in feature_cols]
-
-        self.player_ids = df[spec.id_col].astype(str).to_numpy()
-        self.dates = pd.to_datetime(df[spec.date_col], errors="coerce").dt.normalize().to_numpy()
-        if pd.isna(self.dates).any():
-            raise ValueError(f"Date non parsabili nella colonna {spec.date_col!r}.")
-
-        self.X = torch.tensor(df[feature_cols].to_numpy(), dtype=torch.float32)
-        self.y = torch.tensor(y.to_numpy(), dtype=torch.float32).unsqueeze(1)
-
-        class _TorchDataset(Dataset):
-            def __len__(inner_self):
-                return int(self.X.shape[0])
+        self.label_col = str(meta["label_col"])
+        self.feature_names = [str(c) for c in meta["feature_names"]]
 
-            def __getitem__(inner_self, idx: int):
-                return self.X[idx], self.y[idx]
+        # su disco serve un array <U a larghezza fissa (np.save senza pickle); qui torna object di str come prima
+        self.player_ids = arrays["player_ids"].astype(object)
+        self.dates = arrays["dates"]
 
-        self._dataset = _TorchDataset()
+        self.X = torch.from_numpy(arrays["X"])
+        self.y = torch.from_numpy(arrays["y"]).unsqueeze(1)
+        self._dataset = TensorDataset(self.X, self.y)
 
     def __len__(self) -> int:
         return len(self._dataset)
@@ -147,6 +253,7 @@ def make_dataset(
     id_col: str = "player_id",
     date_col: str = "date",
     drop_cols: Sequence[str] = (),
+    cache: bool = True,
 ) -> InjuryWithinHDaysDataset:
     spec = InjuryDatasetSpec(
         csv_path=Path(csv_path),
@@ -155,5 +262,6 @@ def make_dataset(
         id_col=id_col,
         date_col=date_col,
         drop_cols=tuple(drop_cols),
+        cache=bool(cache),
     )
     return InjuryWithinHDaysDataset(spec)
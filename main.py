@@ -163,8 +163,8 @@ def train_one_epoch(model: torch.nn.Module, loader: DataLoader, criterion: torch
     total = 0
 
     for x, y in loader:
-        x = x.to(device)
-        y = y.to(device)
+        x = x.to(device, non_blocking=True)
+        y = y.to(device, non_blocking=True)
         optimizer.zero_grad(set_to_none=True)
         logits = model(x)
         loss = criterion(logits, y)
@@ -228,7 +228,8 @@ def main(argv: list[str] | None = None) -> int:
     y = ds.y
 
 
-    df = pd.read_csv(args.data)
+    # le date sono già parsate (e in cache) nel dataset: niente seconda lettura del CSV
+    df = pd.DataFrame({"date": ds.dates})
     train_idx, val_idx, test_idx = temporal_purged_split_indices(
         df,
         val_frac=float(args.val_frac),
@@ -262,8 +263,9 @@ def main(argv: list[str] | None = None) -> int:
 
     Xn = (X - mean) / std
     train_set = TensorDataset(Xn[train_idx], y[train_idx])
-    val_set = TensorDataset(Xn[val_idx], y[val_idx])
-    test_set = TensorDataset(Xn[test_idx], y[test_idx]) if len(test_idx) else None
+    # val/test stanno interi in memoria: li copio una volta su device e li valuto senza DataLoader
+    X_val, y_val = Xn[val_idx].to(device), y[val_idx].to(device)
+    X_test, y_test = (Xn[test_idx].to(device), y[test_idx].to(device)) if len(test_idx) else (None, None)
 
     if bool(args.balanced_sampler):
         from torch.utils.data import WeightedRandomSampler
@@ -291,24 +293,6 @@ def main(argv: list[str] | None = None) -> int:
         num_workers=int(args.num_workers),
         pin_memory=(device.type == "cuda"),
     )
-    val_loader = DataLoader(
-        val_set,
-        batch_size=int(args.batch_size),
-        shuffle=False,
-        num_workers=int(args.num_workers),
-        pin_memory=(device.type == "cuda"),
-    )
-    test_loader = (
-        DataLoader(
-            test_set,
-            batch_size=int(args.batch_size),
-            shuffle=False,
-            num_workers=int(args.num_workers),
-            pin_memory=(device.type == "cuda"),
-        )
-        if test_set is not None
-        else None
-    )
 
     hidden_dims = parse_hidden_dims(str(args.hidden_dims))
     print(f"ciao{X.shape}")
@@ -361,7 +345,7 @@ def main(argv: list[str] | None = None) -> int:
     history: list[dict[str, float]] = []
     for epoch in range(1, int(args.epochs) + 1):
         train_loss = train_one_epoch(model, train_loader, criterion, optimizer, device)
-        val_metrics = evaluator.evaluate(model, val_loader, device)
+        val_metrics = evaluator.evaluate_tensors(model, X_val, y_val, device)
 
         history.append(
             {
@@ -463,10 +447,10 @@ def main(argv: list[str] | None = None) -> int:
 
     print(f"OK: best {monitor}={best_metric:.6f} salvato in {save_path}")
 
-    if test_loader is not None:
+    if X_test is not None:
         ckpt = torch.load(save_path, map_location=device)
         model.load_state_dict(ckpt["model_state_dict"])
-        test_metrics = evaluator.evaluate(model, test_loader, device)
+        test_metrics = evaluator.evaluate_tensors(model, X_test, y_test, device)
         print(
             f"Test | loss={test_metrics.loss:.5f} | acc={test_metrics.acc:.4f} | "
             f"ROC-AUC:{test_metrics.roc_auc:.5f} | PR-AUC:{test_metrics.pr_auc:.6f} (baseline~{test_pos_rate:.4f})"
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Iterable
+from typing import Iterable, Sequence
 
+import numpy as np
 import torch
 from torch.utils.data import DataLoader
 
@@ -44,52 +45,43 @@ def _safe_div(num: float, den: float) -> float:
     return float(num) / float(den)
 
 
+def _as_float_array(values: Iterable[float]) -> np.ndarray:
+    if isinstance(values, torch.Tensor):
+        values = values.detach().to("cpu").numpy()
+    elif not isinstance(values, (np.ndarray, Sequence)):
+        values = list(values)
+    return np.asarray(values, dtype=np.float64).reshape(-1)
+
+
 def roc_auc_mann_whitney(probs: Iterable[float], ys: Iterable[float]) -> float:
-    pairs = [(float(p), float(y)) for p, y in zip(probs, ys)]
-    n_pos = sum(1 for _, y in pairs if y >= 0.5)
-    n_neg = len(pairs) - n_pos
+    p = _as_float_array(probs)
+    y_pos = _as_float_array(ys) >= 0.5
+    n_pos = int(y_pos.sum())
+    n_neg = int(y_pos.size) - n_pos
     if n_pos == 0 or n_neg == 0:
         return float("nan")
 
-    pairs.sort(key=lambda t: float(t[0]))
-    ranks = [0.0] * len(pairs)
-    i = 0
-    r = 1
-    while i < len(pairs):
-        j = i
-        while j < len(pairs) and float(pairs[j][0]) == float(pairs[i][0]):
-            j += 1
-        avg_rank = (r + (r + (j - i) - 1)) / 2.0
-        for k in range(i, j):
-            ranks[k] = avg_rank
-        r += (j - i)
-        i = j
-
-    sum_ranks_pos = 0.0
-    for (_, y), rk in zip(pairs, ranks):
-        if float(y) >= 0.5:
-            sum_ranks_pos += float(rk)
-
-    u = sum_ranks_pos - (n_pos * (n_pos + 1)) / 2.0
+    # Rank medio per i tie: i valori uguali occupano le posizioni [cum - counts + 1, cum].
+    _, inv, counts = np.unique(p, return_inverse=True, return_counts=True)
+    cum = np.cumsum(counts)
+    avg_rank = (cum - counts + 1 + cum) / 2.0
+    ranks = avg_rank[inv]
+
+    u = float(ranks[y_pos].sum()) - (n_pos * (n_pos + 1)) / 2.0
     return float(u) / float(n_pos * n_neg)
 
 
 def average_precision(probs: Iterable[float], ys: Iterable[float]) -> float:
-    pairs = sorted(((float(p), float(y)) for p, y in zip(probs, ys)), key=lambda t: float(t[0]), reverse=True)
-    positives_total = sum(1 for _, y in pairs if float(y) >= 0.5)
+    p = _as_float_array(probs)
+    y = (_as_float_array(ys) >= 0.5).astype(np.float64)
+    positives_total = float(y.sum())
     if positives_total == 0:
         return float("nan")
 
-    tp = 0
-    fp = 0
-    precision_sum = 0.0
-    for _, y in pairs:
-        if float(y) >= 0.5:
-            tp += 1
-            precision_sum += tp / max(1, tp + fp)
-        else:
-            fp += 1
-    return float(precision_sum) / float(positives_total)
+    # ordinamento stabile decrescente: a parità di prob resta l'ordine d'ingresso
+    y_sorted = y[np.argsort(-p, kind="stable")]
+    precision = np.cumsum(y_sorted) / np.arange(1, y_sorted.size + 1, dtype=np.float64)
+    return float((precision * y_sorted).sum()) / positives_total
 
 
 class BinaryClassificationEvaluator:
@@ -99,46 +91,67 @@ class BinaryClassificationEvaluator:
 
     @torch.no_grad()
     def evaluate(self, model: torch.nn.Module, loader: DataLoader, device: torch.device) -> BinaryClassificationMetrics:
+        # Ogni batch va su device appena esce dal loader: con un loader pin_memory=True la copia
+        # non_blocking è davvero asincrona. Le metriche sono le stesse di evaluate_tensors().
         model.eval()
+        logits: list[torch.Tensor] = []
+        ys: list[torch.Tensor] = []
+        for x, y in loader:
+            logits.append(model(x.to(device, non_blocking=True)))
+            ys.append(y.to(device, non_blocking=True))
+        if not logits:
+            return self._metrics(None, None)
+        return self._metrics(torch.cat(logits), torch.cat(ys))
 
-        total_loss = 0.0
-        total = 0
-        correct = 0
+    @torch.no_grad()
+    def evaluate_tensors(
+        self,
+        model: torch.nn.Module,
+        X: torch.Tensor,
+        y: torch.Tensor,
+        device: torch.device,
+        *,
+        batch_size: int = 4096,
+    ) -> BinaryClassificationMetrics:
+        """
+        Valuta il modello su tensori già in memoria (niente DataLoader/collate).
+        Se X e y sono già su device non c'è nessuna copia; altrimenti vengono copiati a blocchi di batch_size.
+        Tutte le metriche sono calcolate in un unico passaggio vettoriale sui logits concatenati.
+        """
+        model.eval()
 
-        tn = fp = fn = tp = 0
-        all_probs: list[float] = []
-        all_y: list[float] = []
+        total = int(X.shape[0])
+        if total == 0:
+            return self._metrics(None, None)
+        bs = max(1, int(batch_size))
+        logits = torch.cat([model(X[i : i + bs].to(device, non_blocking=True)) for i in range(0, total, bs)])
+        return self._metrics(logits, y.to(device, non_blocking=True))
 
+    def _metrics(self, logits: torch.Tensor | None, y: torch.Tensor | None) -> BinaryClassificationMetrics:
+        # logits e y (N, 1) sullo stesso device; None = nessun campione
         thr = float(self.threshold)
+        total = 0 if logits is None else int(logits.shape[0])
 
-        for x, y in loader:
-            x = x.to(device)
-            y = y.to(device)
-            logits = model(x)
-            loss = self.criterion(logits, y)
-
-            bs = int(x.shape[0])
-            total_loss += float(loss.item()) * bs
-            total += bs
+        avg_loss = 0.0
+        tn = fp = fn = tp = 0
+        roc_auc = pr_auc = float("nan")
 
-            probs = torch.sigmoid(logits)
-            pred_pos = probs >= thr
-            y_pos = y >= 0.5
+        if logits is not None and y is not None and total > 0:
+            avg_loss = float(self.criterion(logits, y).item())
 
-            correct += int((pred_pos == y_pos).sum().item())
-            tp += int((pred_pos & y_pos).sum().item())
-            tn += int((~pred_pos & ~y_pos).sum().item())
-            fp += int((pred_pos & ~y_pos).sum().item())
-            fn += int((~pred_pos & y_pos).sum().item())
+            probs = torch.sigmoid(logits).flatten()
+            pred_pos = (probs >= thr).long()
+            y_pos = (y >= 0.5).long().flatten()
 
-            all_probs.extend(probs.detach().flatten().to("cpu").tolist())
-            all_y.extend(y.detach().flatten().to("cpu").tolist())
+            # indice 2*y + pred -> 0=TN, 1=FP, 2=FN, 3=TP
+            tn, fp, fn, tp = (int(v) for v in torch.bincount((y_pos << 1) | pred_pos, minlength=4).tolist())
 
-        avg_loss = total_loss / max(1, total)
-        acc = correct / max(1, total)
+            all_probs = probs.to("cpu").numpy()
+            all_y = y.flatten().to("cpu").numpy()
+            roc_auc = roc_auc_mann_whitney(all_probs, all_y)
+            pr_auc = average_precision(all_probs, all_y)
 
-        roc_auc = roc_auc_mann_whitney(all_probs, all_y) if all_probs else float("nan")
-        pr_auc = average_precision(all_probs, all_y) if all_probs else float("nan")
+        acc = (tn + tp) / max(1, total)
 
         precision = _safe_div(tp, tp + fp)
         recall = _safe_div(tp, tp + fn)
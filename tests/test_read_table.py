@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[1] / "webApp" / "scripts"
+SCRIPTS = ("build_rolling_features", "build_survival_labels", "merge_daily_datasets")
+
+CSV = (
+    "Date,p000,note\n"
+    "2024-03-05,1.9831356574888273,a\n"
+    "2024-03-25,,\n"
+    "05.03.2024,2.5,c\n"
+)
+
+
+def _load_script(name: str):
+    # gli script non sono un package: li carico dal path, con un nome di modulo dedicato
+    spec = importlib.util.spec_from_file_location(f"_test_{name}", SCRIPTS_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(params=SCRIPTS)
+def script(request):
+    return _load_script(request.param)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "wellness.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return path
+
+
+def _read(script, path, *, pyarrow: bool, monkeypatch):
+    if not pyarrow:
+        monkeypatch.setitem(sys.modules, "pyarrow", None)  # import pyarrow -> ImportError: parser C
+    return script._read_table(path, str_cols=[0])
+
+
+@pytest.mark.parametrize("pyarrow", [True, False])
+def test_read_table_keeps_date_strings(script, csv_path, pyarrow, monkeypatch):
+    if pyarrow:
+        pytest.importorskip("pyarrow")
+    df = _read(script, csv_path, pyarrow=pyarrow, monkeypatch=monkeypatch)
+
+    assert df["Date"].tolist() == ["2024-03-05", "2024-03-25", "05.03.2024"]
+    assert df["p000"].iloc[0] == 1.9831356574888273
+    assert pd.isna(df["p000"].iloc[1]) and pd.isna(df["note"].iloc[1])
+
+    dates = script._parse_date_col(df["Date"], dayfirst=True)
+    assert dates.tolist() == [pd.Timestamp("2024-03-05"), pd.Timestamp("2024-03-25"), pd.Timestamp("2024-03-05")]
+
+
+def test_read_table_same_frame_on_both_parsers(script, csv_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    with_pyarrow = _read(script, csv_path, pyarrow=True, monkeypatch=monkeypatch)
+    without_pyarrow = _read(script, csv_path, pyarrow=False, monkeypatch=monkeypatch)
+    pd.testing.assert_frame_equal(with_pyarrow, without_pyarrow)
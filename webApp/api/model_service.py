@@ -1,10 +1,78 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import torch
 from webApp.model.FCNN import FCNN
 
+logger = logging.getLogger(__name__)
+
+
+def _bf16_ok(device: torch.device) -> bool:
+    # bf16 conviene solo dove la matmul bf16 è nativa: GPU Ampere+ (cc >= 8.0) o CPU con AVX512_BF16/AMX.
+    if device.type == "cuda":
+        return torch.cuda.get_device_capability(device)[0] >= 8
+    if device.type == "cpu":
+        try:
+            with open("/proc/cpuinfo", encoding="utf-8") as f:
+                flags = f.read()
+        except OSError:  # non Linux: nessun modo affidabile di saperlo, resto in FP32
+            return False
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    return False
+
+
+def _autocast(device: torch.device, enabled: bool):
+    # cache_enabled=False: la cache dei pesi castati di autocast non è compatibile con la cattura dei CUDA graph
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=enabled, cache_enabled=False)
+
+
+def _compile_for_inference(
+    model: torch.nn.Module,
+    *,
+    input_dim: int,
+    device: torch.device,
+    bf16: bool = False,
+) -> torch.nn.Module:
+    # torch.compile fonde Linear + ReLU (Dropout è no-op in eval) e riduce l'overhead di lancio dei kernel,
+    # che con batch=1 domina il costo del forward. La prima chiamata paga la compilazione: la faccio qui
+    # con un input fittizio così non ricade sulla prima richiesta /predict.
+    # Su CUDA il CUDA graph lo catturo io in ModelService (vedi _capture_cuda_graph), quindi niente
+    # cudagraph di Inductor ("reduce-overhead") per non annidare due catture.
+    if not hasattr(torch, "compile"):
+        return model
+    mode = "default" if device.type == "cuda" else "reduce-overhead"
+    try:
+        compiled = torch.compile(model, mode=mode, fullgraph=True)
+        with torch.no_grad(), _autocast(device, bf16):
+            compiled(torch.zeros(1, input_dim, device=device))
+    except Exception as exc:  # backend non disponibile (es. compilatore C++ mancante): resto in eager
+        logger.warning("torch.compile non disponibile, uso il modello eager: %s", exc)
+        return model
+    return compiled
+
+
+def _capture_cuda_graph(model: torch.nn.Module, static_in: torch.Tensor, *, bf16: bool = False):
+    """
+    Cattura un CUDA graph del forward su static_in (1, input_dim).
+    Ritorna (graph, static_out): per inferire si scrive in static_in e si chiama graph.replay().
+    """
+    # warm-up su uno stream laterale, come richiesto prima della cattura
+    side = torch.cuda.Stream(device=static_in.device)
+    side.wait_stream(torch.cuda.current_stream(static_in.device))
+    with torch.no_grad(), torch.cuda.stream(side), _autocast(static_in.device, bf16):
+        for _ in range(3):
+            model(static_in)
+    torch.cuda.current_stream(static_in.device).wait_stream(side)
+
+    graph = torch.cuda.CUDAGraph()
+    with torch.no_grad(), torch.cuda.graph(graph), _autocast(static_in.device, bf16):
+        static_out = model(static_in)
+    return graph, static_out
+
 
 @dataclass
 class ModelService:
@@ -15,12 +83,49 @@ class ModelService:
     std: Optional[torch.Tensor] = None
     threshold: float = 0.3
     model_version: str = "v1"
+    bf16: bool = False  # forward in autocast bfloat16; i pesi restano FP32
+
+    # stato runtime preparato una volta in __post_init__ e riusato a ogni richiesta
+    _order: Tuple[str, ...] = field(init=False, repr=False, default=())
+    _buf: Optional[torch.Tensor] = field(init=False, repr=False, default=None)
+    _inv_std: Optional[torch.Tensor] = field(init=False, repr=False, default=None)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _graph: Optional["torch.cuda.CUDAGraph"] = field(init=False, repr=False, default=None)
+    _graph_out: Optional[torch.Tensor] = field(init=False, repr=False, default=None)
+
+    def __post_init__(self) -> None:
+        self._order = tuple(self.order)
+        self._buf = torch.zeros(len(self._order), dtype=torch.float32, device=self.device)
+        # 1/(std+eps) calcolato una volta: a ogni richiesta basta sub_ + mul_ in-place (self.std resta invariato)
+        if self.std is not None:
+            self._inv_std = (self.std + 1e-8).reciprocal_()
+
+        # Su GPU il buffer di input è anche l'input statico del CUDA graph: _vectorize ci scrive dentro
+        # e predict_proba fa solo replay(), un unico lancio invece di un kernel per layer.
+        if self.device.type == "cuda":
+            try:
+                self._graph, self._graph_out = _capture_cuda_graph(self.model, self._buf.view(1, -1), bf16=self.bf16)
+            except Exception as exc:
+                logger.warning("Cattura CUDA graph fallita, uso il forward normale: %s", exc)
+                self._graph = self._graph_out = None
 
     @classmethod
-    def load(cls, *, weights_path: str, model_version: str = "v1") -> "ModelService":
+    def load(
+        cls,
+        *,
+        weights_path: str,
+        model_version: str = "v1",
+        compile_model: bool = True,
+        bf16: Optional[bool] = None,
+    ) -> "ModelService":
         # questo modello serve a caricare il modello migliorare del training
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        ckpt = torch.load(weights_path, map_location=device) # carico il modello ssalvato in outputs che è un dizionario tipo cosi :
+        if bf16 is None:
+            bf16 = _bf16_ok(device)
+        # carico il modello ssalvato in outputs che è un dizionario tipo cosi (sotto).
+        # mmap=True: i tensori restano mappati sul file (pagine condivise tra i worker dopo il fork),
+        # weights_only=True: niente unpickler generico, solo tensori e tipi base.
+        ckpt = torch.load(weights_path, map_location="cpu", mmap=True, weights_only=True)
         """
         {
             "model_state_dict": ...,
@@ -47,17 +152,21 @@ class ModelService:
                 hidden_dims=hidden_dims,
                 dropout=dropout,
                 batch_norm=batch_norm,
-            ).to(device) #crea il modello stesso del modello migliore del training
+            ) #crea il modello stesso del modello migliore del training
 
-            model.load_state_dict(ckpt["model_state_dict"]) #carica i pesi migliori
+            # assign=True: su CPU i parametri puntano direttamente ai tensori mmap del checkpoint (nessuna copia)
+            model.load_state_dict(ckpt["model_state_dict"], assign=True) #carica i pesi migliori
+            model.to(device)
             model.eval()
+            if compile_model:
+                model = _compile_for_inference(model, input_dim=input_dim, device=device, bf16=bf16)
 
             mean = ckpt.get("mean", None)
             std = ckpt.get("std", None)
             if mean is not None:
-                mean = mean.to(device).float()
+                mean = mean.to(device, non_blocking=True).float()
             if std is not None:
-                std = std.to(device).float()
+                std = std.to(device, non_blocking=True).float()
 
             return cls(
                 model=model,
@@ -67,25 +176,33 @@ class ModelService:
                 std=std,
                 threshold=threshold,
                 model_version=model_version,
+                bf16=bf16,
             )
 
     def _vectorize(self, features: Dict[str, float]) -> torch.Tensor:
-        x = torch.tensor([float(features[name]) for name in self.order],
-                         dtype=torch.float32, device=self.device)  # (32,)
+        # scrive nel buffer preallocato: va chiamato tenendo self._lock
+        vals = np.fromiter((features[name] for name in self._order), dtype=np.float32, count=len(self._order))
+        x = self._buf
+        x.copy_(torch.from_numpy(vals))  # (32,)
 
         # questo si fa perchè lo facciamo anche nel main.py ed è una standdarizione delle feature
-        if self.mean is not None and self.std is not None:
-            x = (x - self.mean) / (self.std + 1e-8)
+        if self.mean is not None and self._inv_std is not None:
+            x.sub_(self.mean).mul_(self._inv_std)
 
         return x.unsqueeze(0)  # (1,32) # vettore di input alla rete con le feature rollate
 
     @torch.no_grad()
     def predict_proba(self, features: Dict[str, float]) -> float:
-        x = self._vectorize(features)
-        logits = self.model(x)              # (1,1)
-        print(logits)
-        prob = torch.sigmoid(logits).item() # float in [0,1]
-        print(prob)
+        with self._lock:
+            x = self._vectorize(features)
+            if self._graph is not None:
+                self._graph.replay()
+                logits = self._graph_out        # (1,1), scritto in-place dal replay
+            else:
+                with _autocast(self.device, self.bf16):
+                    logits = self.model(x)      # (1,1)
+            prob = torch.sigmoid(logits.float()).item() # float in [0,1]
+        logger.debug("predict_proba: prob=%.6f", prob)
         return float(prob)
 
     def predict_label(self, prob: float) -> int:
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import Dict, List
-import math
+
+import numpy as np
 
 BASE_FEATURES = [
     "speed_mean", "speed_max", "speed_std",
@@ -8,13 +9,6 @@ BASE_FEATURES = [
     "gyro_norm_mean", "gyro_norm_max",
 ] # feature che manda l'utente in input (manda 7 giorni o sessioni)
 
-def _mean(xs: List[float]) -> float:
-    return sum(xs) / len(xs)
-
-def _std(xs: List[float]) -> float:
-    m = _mean(xs)
-    return math.sqrt(sum((x - m) ** 2 for x in xs) / len(xs))
-
 def compute_input_vector(last_7_days: List[Dict[str, float]]) -> Dict[str, float]:
     """
     # prende in ingresso una lista di 7 giorni del tipo {speedmean : 0.5,speedstd 0.7},{speedmean : 0.5,...} ... x altre 5 volte
@@ -29,18 +23,19 @@ def compute_input_vector(last_7_days: List[Dict[str, float]]) -> Dict[str, float
             if f not in day:
                 raise ValueError(f"Giorno {i}: manca la feature '{f}'.")
 
-    out: Dict[str, float] = {}
+    # matrice (7, 8): una riga per giorno, una colonna per base feature
+    arr = np.array([[float(day[f]) for f in BASE_FEATURES] for day in last_7_days], dtype=np.float64)
 
-    current = last_7_days[-1]
-    for f in BASE_FEATURES:
-        out[f] = float(current[f])
+    #rolling su 7 giorni per ciascuna base feature (std di popolazione, ddof=0)
+    means = arr.mean(axis=0)
+    maxs = arr.max(axis=0)
+    stds = arr.std(axis=0)
 
-    #rolling su 7 giorni per ciascuna base feature
-    for f in BASE_FEATURES:
-        series = [float(day[f]) for day in last_7_days]
-        out[f"roll7_mean_{f}"] = float(_mean(series))
-        out[f"roll7_max_{f}"] = float(max(series))
-        out[f"roll7_std_{f}"] = float(_std(series))
+    out: Dict[str, float] = dict(zip(BASE_FEATURES, arr[-1].tolist()))
+    for f, m, mx, sd in zip(BASE_FEATURES, means.tolist(), maxs.tolist(), stds.tolist()):
+        out[f"roll7_mean_{f}"] = m
+        out[f"roll7_max_{f}"] = mx
+        out[f"roll7_std_{f}"] = sd
 
     return out
 
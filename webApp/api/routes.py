@@ -1,16 +1,21 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, current_app, request, jsonify, render_template
 from webApp.api.model_service import ModelService
 from webApp.api.preprocess import compute_input_vector
+import orjson
 import pandas as pd
+import logging
 import os
 import shutil
 from werkzeug.utils import secure_filename
+from functools import lru_cache
+import hashlib
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
 DATA_DIR = os.path.join(ROOT_DIR, "frontend", "data")
 
 api_bp = Blueprint("api", __name__)
+logger = logging.getLogger(__name__)
 
 # carico il modello migliore che ho ottenuto dal training
 model_service = ModelService.load(
@@ -38,9 +43,8 @@ def predict():
 
     try:
         engineered = compute_input_vector(last_7_days)  # ritorna le feature rolled quindi dizionario con 32 feature dentro
-        print(engineered)
         prob = model_service.predict_proba(engineered) # engineered è qualcosa del tipo {speed:,speed_max:,speed_7d:}
-        print(f"Questa è la probabilità : {prob}")
+        logger.debug("Questa è la probabilità : %s", prob)
         label = model_service.predict_label(prob)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -51,16 +55,42 @@ def predict():
     })
 
 
-def load_team_data(team_id, csv_file, limit=10000):
+# cartella -> (st_mtime_ns, body json, etag): i listing si ricalcolano solo se la cartella cambia
+_listing_cache = {}
+
+
+def _listing_response(dir_path, build):
+    # build() ritorna la lista da serializzare; ETag + If-None-Match permettono al browser di ricevere un 304
+    mtime_ns = os.stat(dir_path).st_mtime_ns
+    cached = _listing_cache.get(dir_path)
+    if cached is None or cached[0] != mtime_ns:
+        body = orjson.dumps(build())
+        cached = (mtime_ns, body, hashlib.md5(body, usedforsecurity=False).hexdigest())
+        _listing_cache[dir_path] = cached
+
+    resp = current_app.response_class(cached[1], mimetype="application/json")
+    resp.set_etag(cached[2])
+    return resp.make_conditional(request)
+
+
+@lru_cache(maxsize=32)
+def _team_csv_json(csv_path, mtime_ns, size, limit):
+    # mtime_ns/size fanno parte della chiave: se il file cambia la vecchia entry non viene più colpita
+    df = pd.read_csv(csv_path, nrows=limit)
+    # orjson serializza in C (e NaN -> null, JSON valido) invece del json della stdlib usato da jsonify
+    return orjson.dumps(df.to_dict(orient="records"))
+
+
+def load_team_json(team_id, csv_file, limit=10000):
     team_dir = os.path.join(DATA_DIR, str(team_id))
     csv_path = os.path.join(team_dir, csv_file)
 
-    if not os.path.exists(csv_path):
-        raise FileNotFoundError(f"CSV non trovato: {csv_file} per team_id={team_id}")
-
-    df = pd.read_csv(csv_path)
+    try:
+        st = os.stat(csv_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"CSV non trovato: {csv_file} per team_id={team_id}") from None
 
-    return df
+    return _team_csv_json(csv_path, st.st_mtime_ns, st.st_size, limit)
 
 
 @api_bp.route("/")
@@ -83,12 +113,12 @@ def api_team_files(team_id):
     if not os.path.exists(team_dir):
         return jsonify([])
 
-    files = [
-        f for f in os.listdir(team_dir)
-        if f.endswith(".csv")
-    ]
+    def build():
+        # scandir: i DirEntry hanno già nome e tipo, niente stat per ogni file
+        with os.scandir(team_dir) as it:
+            return [e.name for e in it if e.is_file() and e.name.endswith(".csv")]
 
-    return jsonify(files)
+    return _listing_response(team_dir, build)
 
 @api_bp.route("/api/teams")
 def api_teams():
@@ -96,12 +126,11 @@ def api_teams():
     if not os.path.exists(DATA_DIR):
         return jsonify([])
 
-    teams = [
-        d for d in os.listdir(DATA_DIR)
-        if os.path.isdir(os.path.join(DATA_DIR, d))
-    ]
+    def build():
+        with os.scandir(DATA_DIR) as it:
+            return sorted(e.name for e in it if e.is_dir())
 
-    return jsonify(sorted(teams))
+    return _listing_response(DATA_DIR, build)
 
 @api_bp.route("/api/upload", methods=["POST"])
 def upload_csv():
@@ -135,8 +164,8 @@ def api_team_features(team_id):
         return jsonify({"error": "Devi specificare il parametro 'file'"}), 400
 
     try:
-        df = load_team_data(team_id, csv_file, limit=10000)
-        return jsonify(df.to_dict(orient="records"))
+        body = load_team_json(team_id, csv_file, limit=10000)
+        return current_app.response_class(body, mimetype="application/json")
     except FileNotFoundError as e:
         return jsonify({"error": str(e)}), 404
 
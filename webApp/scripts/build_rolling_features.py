@@ -1,28 +1,368 @@
 from __future__ import annotations
 
 import argparse
+import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 
-def _require_pandas():
+try:
+    import pandas as pd  # type: ignore
+except ImportError as exc:  # pragma: no cover
+    raise SystemExit(
+        "Dipendenza mancante: pandas.\n"
+        "Installa con: pip install pandas\n"
+        f"Dettagli: {exc}"
+    ) from exc
+
+try:
+    import numba  # type: ignore
+except ImportError:  # pragma: no cover - numba è opzionale: senza si usa l'engine pandas
+    numba = None
+
+
+def _require_numba():
+    if numba is None:
+        raise SystemExit(
+            "Dipendenza mancante: numba (richiesta da --engine numba).\n"
+            "Installa con: pip install numba\n"
+            "Oppure usa --engine pandas."
+        )
+    return numba
+
+
+def _require_polars():
     try:
-        import pandas as pd  # type: ignore
+        import polars as pl  # type: ignore
     except ImportError as exc:  # pragma: no cover
         raise SystemExit(
-            "Dipendenza mancante: pandas.\n"
-            "Installa con: pip install pandas\n"
+            "Dipendenza mancante: polars (richiesta da --engine polars).\n"
+            "Installa con: pip install polars\n"
             f"Dettagli: {exc}"
         ) from exc
-    return pd
+    return pl
+
+
+def _require_dask():
+    try:
+        import dask.dataframe as dd  # type: ignore
+    except ImportError as exc:  # pragma: no cover
+        raise SystemExit(
+            "Dipendenza mancante: dask (richiesta da --engine dask).\n"
+            'Installa con: pip install "dask[dataframe]"\n'
+            f"Dettagli: {exc}"
+        ) from exc
+    return dd
+
+
+def _read_table(path: Path, *, str_cols=()):
+    # Formato dal suffisso: .parquet (tipi e date preservati) oppure CSV.
+    # Per i CSV si usa il parser multi-thread di pyarrow se installato, altrimenti quello C di pandas.
+    # pyarrow legge i float in modo esatto: round_trip fa lo stesso col parser C (quello di default
+    # sbaglia a volte l'ultima cifra), così l'output non dipende da quale parser è installato.
+    # str_cols (nomi o posizioni) restano stringhe su entrambi i parser: pyarrow convertirebbe da solo
+    # le date ISO e il parser C no, invece le date le interpreta solo _parse_date_col.
+    if Path(path).suffix.lower() == ".parquet":
+        return pd.read_parquet(path)
+    try:
+        import pyarrow as pa  # type: ignore
+        from pyarrow import csv as pa_csv  # type: ignore
+    except ImportError:
+        return pd.read_csv(path, float_precision="round_trip", dtype={c: str for c in str_cols})
+
+    # pd.read_csv(engine="pyarrow") non accetta column_types: stesse opzioni, ma chiamando pyarrow direttamente
+    header = pd.read_csv(path, nrows=0).columns if any(isinstance(c, int) for c in str_cols) else None
+    convert = pa_csv.ConvertOptions(
+        column_types={header[c] if isinstance(c, int) else c: pa.string() for c in str_cols},
+        null_values=[*pa_csv.ConvertOptions().null_values, "<NA>", "None"],  # i default NA di pandas
+        strings_can_be_null=True,
+    )
+    table = pa_csv.read_csv(path, convert_options=convert)
+    # colonne tutte vuote -> float64, come fa pandas
+    table = table.cast(pa.schema([f.with_type(pa.float64()) if pa.types.is_null(f.type) else f for f in table.schema]))
+    return table.to_pandas()
+
+
+def _write_table(df, path: Path) -> None:
+    if Path(path).suffix.lower() == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        # le colonne datetime le formatta il writer: niente colonna di stringhe materializzata prima
+        df.to_csv(path, index=False, date_format="%Y-%m-%d")
 
 
 def _parse_date_col(series, *, dayfirst: bool):
-    pd = _require_pandas()
-    dt = pd.to_datetime(series, errors="coerce", dayfirst=dayfirst)
+    if pd.api.types.is_datetime64_any_dtype(series):  # es. da Parquet: niente parsing da stringa
+        return series.dt.normalize()
+    if not dayfirst:
+        return pd.to_datetime(series, errors="coerce").dt.normalize()
+    # dayfirst vale per le date giorno-prima: quelle anno-prima (ISO) restano Y-m-d, non Y-d-m
+    iso = series.astype(str).str.match(r"\s*\d{4}-\d{1,2}-\d{1,2}")
+    dt = pd.to_datetime(series.mask(iso), errors="coerce", dayfirst=True)
+    if iso.any():
+        dt = dt.mask(iso, pd.to_datetime(series.where(iso), errors="coerce", format="ISO8601"))
     return dt.dt.normalize()
 
 
+# Kernel rolling per gruppo. Layout SoA: x è (n_cols, n_rows) float64, ogni colonna contigua, con le righe
+# già ordinate per (id, date); il gruppo g occupa le righe [starts[g], ends[g]). Come pandas, i NaN non
+# contano come osservazioni e min_periods si confronta con il numero di valori non-NaN nella finestra.
+# Ogni (colonna, gruppo) è indipendente: prange sul prodotto dei due.
+_W7 = 7  # finestra di default, con kernel dedicato (_roll_all_w7)
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _roll_mean_std(x, starts, ends, window, min_periods, out_mean, out_std):
+        # mean e std (ddof=0) nella stessa passata: Welford con add/remove O(1) per passo, più stabile
+        # di sum/sum-of-squares su valori grandi. Come pandas, se tutti i valori della finestra sono
+        # uguali la std è esattamente 0 (niente residui di cancellazione).
+        n_groups = starts.shape[0]
+        for job in numba.prange(n_groups * x.shape[0]):
+            c = job // n_groups
+            g = job - c * n_groups
+            xc = x[c]
+            s = starts[g]
+            mean = 0.0
+            ssqdm = 0.0
+            nobs = 0
+            prev = np.nan
+            same = 0
+            for i in range(s, ends[g]):
+                v = xc[i]
+                if v == v:
+                    nobs += 1
+                    delta = v - mean
+                    mean += delta / nobs
+                    ssqdm += delta * (v - mean)
+                    if v == prev:
+                        same += 1
+                    else:
+                        prev = v
+                        same = 1
+                j = i - window
+                if j >= s:
+                    old = xc[j]
+                    if old == old:
+                        nobs -= 1
+                        if nobs > 0:
+                            delta = old - mean
+                            mean -= delta / nobs
+                            ssqdm -= delta * (old - mean)
+                        else:
+                            mean = 0.0
+                            ssqdm = 0.0
+                if nobs >= min_periods and nobs > 0:
+                    out_mean[c, i] = mean
+                    out_std[c, i] = 0.0 if same >= nobs else np.sqrt(max(ssqdm / nobs, 0.0))
+                else:
+                    out_mean[c, i] = np.nan
+                    out_std[c, i] = np.nan
+
+    @numba.njit(parallel=True, cache=True, boundscheck=False)
+    def _roll_max(x, starts, ends, window, min_periods, out):
+        # deque monotona (decrescente) di indici: in testa c'è sempre il massimo della finestra, O(1) ammortizzato.
+        # Contiene solo indici della finestra corrente, quindi basta un ring buffer di `window` slot
+        # allocato una volta per job (head/tail crescono sempre, lo slot è contatore % window).
+        n_groups = starts.shape[0]
+        for job in numba.prange(n_groups * x.shape[0]):
+            c = job // n_groups
+            g = job - c * n_groups
+            xc = x[c]
+            s = starts[g]
+            dq = np.empty(window, dtype=np.int64)
+            head = 0
+            tail = 0
+            nobs = 0
+            for i in range(s, ends[g]):
+                # prima si toglie l'indice uscito dalla finestra (al più uno per passo), poi si inserisce i:
+                # così nel ring non ci sono mai più di `window` indici
+                j = i - window
+                if j >= s and xc[j] == xc[j]:
+                    nobs -= 1
+                if tail > head and dq[head % window] <= j:
+                    head += 1
+                v = xc[i]
+                if v == v:
+                    nobs += 1
+                    while tail > head and xc[dq[(tail - 1) % window]] <= v:
+                        tail -= 1
+                    dq[tail % window] = i
+                    tail += 1
+                out[c, i] = xc[dq[head % window]] if nobs >= min_periods and nobs > 0 else np.nan
+
+    @numba.njit(parallel=True, cache=True, boundscheck=False)
+    def _roll_all_w7(x, starts, ends, min_periods, out_mean, out_max, out_std):
+        # Specializzazione per la finestra di default (--window 7): _W7 è una costante globale, quindi il
+        # loop interno ha trip count fisso e LLVM lo srotola. Ogni riga ricalcola mean/max/std (due
+        # passate, niente stato accumulato) sugli ultimi 7 valori, tutte e tre le statistiche insieme.
+        # Niente fastmath: presuppone assenza di NaN e romperebbe i controlli v == v.
+        n_groups = starts.shape[0]
+        for job in numba.prange(n_groups * x.shape[0]):
+            c = job // n_groups
+            g = job - c * n_groups
+            xc = x[c]
+            s = starts[g]
+            for i in range(s, ends[g]):
+                lo = i - (_W7 - 1)
+                total = 0.0
+                nobs = 0
+                v_max = -np.inf
+                v_min = np.inf
+                for k in range(_W7):
+                    j = lo + k
+                    if j >= s:
+                        v = xc[j]
+                        if v == v:
+                            total += v
+                            nobs += 1
+                            v_max = max(v_max, v)
+                            v_min = min(v_min, v)
+                if nobs < min_periods or nobs == 0:
+                    out_mean[c, i] = np.nan
+                    out_max[c, i] = np.nan
+                    out_std[c, i] = np.nan
+                    continue
+                mean = total / nobs
+                ssq = 0.0
+                if v_min != v_max:  # finestra costante: std esattamente 0 come pandas
+                    for k in range(_W7):
+                        j = lo + k
+                        if j >= s:
+                            v = xc[j]
+                            if v == v:
+                                ssq += (v - mean) * (v - mean)
+                out_mean[c, i] = mean
+                out_max[c, i] = v_max
+                out_std[c, i] = np.sqrt(ssq / nobs)
+
+
+@lru_cache(maxsize=None)
+def _serial_kernels():
+    # Stessi kernel compilati single-thread e nogil, per chi parallelizza già da fuori (engine dask):
+    # il threading layer di default di numba (workqueue) non regge lanci paralleli da più thread.
+    return (
+        numba.njit(nogil=True)(_roll_mean_std.py_func),
+        numba.njit(nogil=True)(_roll_max.py_func),
+        numba.njit(nogil=True)(_roll_all_w7.py_func),
+    )
+
+
+def _rolling_numba(
+    df,
+    *,
+    id_col: str,
+    feature_cols: list,
+    window: int,
+    min_periods: int,
+    stats: tuple[str, ...],
+    parallel: bool = True,
+):
+    _require_numba()
+    roll_mean_std, roll_max, roll_all_w7 = (_roll_mean_std, _roll_max, _roll_all_w7) if parallel else _serial_kernels()
+
+    # (n_cols, n_rows): stesso layout dei blocchi float64 di pandas, quindi anche i risultati
+    # si riavvolgono in DataFrame senza copie (out.T)
+    x = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=np.float64, na_value=np.nan).T)
+    codes = df[id_col].cat.codes.to_numpy()
+    change = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.r_[0, change].astype(np.int64) if len(df) else np.empty(0, dtype=np.int64)
+    ends = np.r_[change, len(df)].astype(np.int64) if len(df) else np.empty(0, dtype=np.int64)
+
+    # un solo buffer (n_stats * n_cols, n_rows): ogni kernel scrive nella sua fetta di righe
+    order = [stat for stat in ("mean", "max", "std") if stat in stats]
+    n_cols = len(feature_cols)
+    out = np.empty((len(order) * n_cols, len(df)), dtype=np.float64)
+    block = {stat: out[k * n_cols : (k + 1) * n_cols] for k, stat in enumerate(order)}
+
+    if window == _W7:
+        scratch = {stat: block[stat] if stat in block else np.empty_like(x) for stat in ("mean", "max", "std")}
+        roll_all_w7(x, starts, ends, int(min_periods), scratch["mean"], scratch["max"], scratch["std"])
+    elif "mean" in block or "std" in block:
+        out_mean = block["mean"] if "mean" in block else np.empty_like(x)
+        out_std = block["std"] if "std" in block else np.empty_like(x)
+        roll_mean_std(x, starts, ends, int(window), int(min_periods), out_mean, out_std)
+    if "max" in block and window != _W7:
+        roll_max(x, starts, ends, int(window), int(min_periods), block["max"])
+
+    cols = [f"roll{window}_{stat}_{c}" for stat in order for c in feature_cols]
+    return pd.DataFrame(out.T, columns=cols, index=df.index, copy=False)
+
+
+def _rolling_pandas(df, *, id_col: str, feature_cols: list, window: int, min_periods: int, stats: tuple[str, ...]):
+    order = [stat for stat in ("mean", "max", "std") if stat in stats]
+    n_cols = len(feature_cols)
+    out = np.empty((len(order) * n_cols, len(df)), dtype=np.float64)
+
+    r = df.groupby(id_col, group_keys=False, observed=True)[feature_cols].rolling(window=window, min_periods=min_periods)
+    for k, stat in enumerate(order):
+        part = r.std(ddof=0) if stat == "std" else getattr(r, stat)()
+        part = part.reset_index(level=0, drop=True)
+        if not part.index.equals(df.index):
+            part = part.reindex(df.index)
+        # copiato subito nella sua fetta del buffer: al più un risultato intermedio vivo alla volta
+        out[k * n_cols : (k + 1) * n_cols] = part.to_numpy(dtype=np.float64, na_value=np.nan).T
+        del part
+
+    cols = [f"roll{window}_{stat}_{c}" for stat in order for c in feature_cols]
+    return pd.DataFrame(out.T, columns=cols, index=df.index, copy=False)
+
+
+def _rolling_polars(df, *, id_col: str, feature_cols: list, window: int, min_periods: int, stats: tuple[str, ...]):
+    pl = _require_polars()
+
+    # df è già ordinato per (id, date): .over(id) calcola ogni finestra in una sola passata per colonna
+    # e mantiene l'ordine delle righe. Cast a Float64 per avere output float come pandas (max su int).
+    # from_pandas converte i NaN in null, che le rolling di polars saltano come pandas.
+    lf = pl.from_pandas(df[[id_col, *feature_cols]]).lazy()
+    lf = lf.with_columns(pl.col(feature_cols).cast(pl.Float64))
+
+    def rolled(stat: str, c: str):
+        col = pl.col(c)
+        if stat == "mean":
+            expr = col.rolling_mean(window, min_samples=min_periods)
+        elif stat == "max":
+            expr = col.rolling_max(window, min_samples=min_periods)
+        else:
+            expr = col.rolling_std(window, min_samples=min_periods, ddof=0)
+        return expr.over(id_col).alias(f"roll{window}_{stat}_{c}")
+
+    exprs = [rolled(stat, c) for stat in ("mean", "max", "std") if stat in stats for c in feature_cols]
+    out = lf.select(exprs).collect().to_pandas()
+    out.index = df.index
+    return out
+
+
+def _rolling_dask(df, *, id_col: str, feature_cols: list, window: int, min_periods: int, stats: tuple[str, ...]):
+    dd = _require_dask()
+
+    # ogni partizione viene elaborata dai kernel numba single-thread (nogil: scheduler a thread) o da pandas
+    inner = _rolling_numba if numba is not None else _rolling_pandas
+    kwargs = dict(id_col=id_col, feature_cols=feature_cols, window=window, min_periods=min_periods, stats=stats)
+    if numba is not None:
+        kwargs["parallel"] = False
+    cols = [f"roll{window}_{stat}_{c}" for stat in ("mean", "max", "std") if stat in stats for c in feature_cols]
+
+    # partizioni di almeno `window` righe: a ciascuna si antepongono le window-1 righe precedenti
+    # (map_overlap), che bastano a completare le finestre dei player a cavallo tra due blocchi
+    n_parts = max(1, min((os.cpu_count() or 1) * 2, len(df) // max(window, 1)))
+    if n_parts == 1:
+        return inner(df, **kwargs)
+
+    ddf = dd.from_pandas(df[[id_col, *feature_cols]], npartitions=n_parts, sort=False)
+    rolled = ddf.map_overlap(
+        lambda part: inner(part, **kwargs),
+        window - 1,
+        0,
+        meta=pd.DataFrame({c: pd.Series(dtype=np.float64) for c in cols}),
+    )
+    out = rolled.compute(scheduler="threads")
+    out.index = df.index
+    return out
+
+
 def build_rolling_features(
     df,
     *,
@@ -32,68 +372,64 @@ def build_rolling_features(
     min_periods: int,
     stats: tuple[str, ...],
     exclude_cols: set[str],
+    engine: str = "auto",
 ):
-    pd = _require_pandas()
-
+    """
+    engine: "numba" (kernel compilati, una passata per colonna e gruppo), "polars" (espressioni .over(id)),
+    "dask" (blocchi di righe in parallelo con overlap di window-1), "pandas" (groupby().rolling())
+    oppure "auto" (numba se installato, altrimenti pandas).
+    Le colonne in output sono le stesse.
+    """
     if window <= 0:
         raise ValueError("window deve essere >= 1")
     if min_periods <= 0:
         raise ValueError("min_periods deve essere >= 1")
+    if min_periods > window:
+        raise ValueError("min_periods deve essere <= window")
+    if engine == "auto":
+        engine = "numba" if numba is not None else "pandas"
+    if engine not in {"numba", "polars", "dask", "pandas"}:
+        raise ValueError(f"engine non supportato: {engine!r}")
 
     missing = {c for c in [id_col, date_col] if c not in df.columns}
     if missing:
         raise ValueError(f"CSV senza colonne richieste: {sorted(missing)}")
 
-    df = df.copy()
-    df[id_col] = df[id_col].astype(str).str.strip()
-    df[date_col] = _parse_date_col(df[date_col], dayfirst=False)
+    # assign invece di copy(): si copiano solo le due colonne trasformate, il resto resta condiviso (CoW).
+    # player_id categorico: sort e groupby lavorano sui codici interi, non sulle stringhe.
+    df = df.assign(
+        **{
+            id_col: pd.Categorical(df[id_col].astype(str).str.strip()),
+            date_col: _parse_date_col(df[date_col], dayfirst=False),
+        }
+    )
     df = df.dropna(subset=[id_col, date_col])
 
     df = df.sort_values([id_col, date_col], kind="mergesort").reset_index(drop=True)
 
     feature_cols = [c for c in df.columns if c not in exclude_cols]
-    for c in feature_cols:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+    # coercion solo delle colonne non ancora numeriche (per le altre to_numeric è un no-op),
+    # tutte con un unico __setitem__ invece di uno per colonna
+    to_coerce = [c for c in feature_cols if not pd.api.types.is_numeric_dtype(df[c])]
+    if to_coerce:
+        df[to_coerce] = df[to_coerce].apply(pd.to_numeric, errors="coerce")
 
     feature_cols = [c for c in feature_cols if pd.api.types.is_numeric_dtype(df[c])]
     if not feature_cols:
         raise ValueError("Nessuna feature numerica trovata (dopo exclude e coercion).")
 
-    g = df.groupby(id_col, group_keys=False)
-
-    rolled_parts = []
-    if "mean" in stats:
-        part = (
-            g[feature_cols]
-            .rolling(window=window, min_periods=min_periods)
-            .mean()
-            .reset_index(level=0, drop=True)
-            .add_prefix(f"roll{window}_mean_")
-        )
-        rolled_parts.append(part)
-    if "max" in stats:
-        part = (
-            g[feature_cols]
-            .rolling(window=window, min_periods=min_periods)
-            .max()
-            .reset_index(level=0, drop=True)
-            .add_prefix(f"roll{window}_max_")
-        )
-        rolled_parts.append(part)
-    if "std" in stats:
-        part = (
-            g[feature_cols]
-            .rolling(window=window, min_periods=min_periods)
-            .std(ddof=0)
-            .reset_index(level=0, drop=True)
-            .add_prefix(f"roll{window}_std_")
-        )
-        rolled_parts.append(part)
-
-    if not rolled_parts:  # pragma: no cover
+    if not any(stat in stats for stat in ("mean", "max", "std")):  # pragma: no cover
         raise ValueError("stats vuoto: niente da calcolare.")
 
-    return pd.concat([df, *rolled_parts], axis=1)
+    # ogni engine produce un unico DataFrame con tutte le colonne roll*, attaccato con un solo concat
+    rolling_fn = {
+        "numba": _rolling_numba,
+        "polars": _rolling_polars,
+        "dask": _rolling_dask,
+        "pandas": _rolling_pandas,
+    }[engine]
+    rolled = rolling_fn(df, id_col=id_col, feature_cols=feature_cols, window=window, min_periods=min_periods, stats=stats)
+    return pd.concat([df, rolled], axis=1)
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
@@ -107,13 +443,13 @@ def build_arg_parser() -> argparse.ArgumentParser:
         "--input",
         default="dataset/subjective/objective.csv",
         type=Path,
-        help="CSV input (deve contenere player_id e date).",
+        help="CSV o Parquet input (deve contenere player_id e date).",
     )
     parser.add_argument(
         "--output",
         default="dataset/processed/objective_rolling_7d.csv",
         type=Path,
-        help="Dove salvare il CSV con le colonne roll* aggiunte.",
+        help="Dove salvare il risultato con le colonne roll* aggiunte (.csv oppure .parquet).",
     )
     parser.add_argument("--window", type=int, default=7, help="Lunghezza finestra rolling (numero righe).")
     parser.add_argument("--min-periods", type=int, default=1, help="Minimo numero di osservazioni per calcolare.")
@@ -130,14 +466,19 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default="mean,max,std",
         help="Statistiche da calcolare tra: mean,max,std (separate da virgola).",
     )
+    parser.add_argument(
+        "--engine",
+        default="auto",
+        choices=["auto", "numba", "polars", "dask", "pandas"],
+        help="Motore per le rolling: numba (kernel compilati), polars, dask, pandas, auto (numba se installato).",
+    )
     return parser
 
 
 def main(argv: list[str]) -> int:
-    pd = _require_pandas()
     args = build_arg_parser().parse_args(argv)
 
-    df = pd.read_csv(args.input)
+    df = _read_table(args.input, str_cols=[args.date_col])
 
     stats = tuple(s.strip().lower() for s in str(args.stats).split(",") if s.strip())
     allowed = {"mean", "max", "std"}
@@ -155,12 +496,12 @@ def main(argv: list[str]) -> int:
         min_periods=int(args.min_periods),
         stats=stats,
         exclude_cols=exclude_cols,
+        engine=str(args.engine),
     )
 
     output_path: Path = args.output
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    out[args.date_col] = pd.to_datetime(out[args.date_col]).dt.strftime("%Y-%m-%d")
-    out.to_csv(output_path, index=False)
+    _write_table(out, output_path)
 
     print(f"OK: salvato {output_path} ({out.shape[0]} righe, {out.shape[1]} colonne)")
     return 0
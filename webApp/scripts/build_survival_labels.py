@@ -6,40 +6,78 @@ from pathlib import Path
 
 import numpy as np
 
-
-def _require_pandas():
+try:
+    import pandas as pd  # type: ignore
+except ImportError as exc:  # pragma: no cover
+    raise SystemExit(
+        "Dipendenza mancante: pandas.\n"
+        "Installa con: pip install pandas\n"
+        f"Dettagli: {exc}"
+    ) from exc
+
+
+def _read_table(path: Path, *, str_cols=()):
+    # Formato dal suffisso: .parquet (tipi e date preservati) oppure CSV.
+    # Per i CSV si usa il parser multi-thread di pyarrow se installato, altrimenti quello C di pandas.
+    # pyarrow legge i float in modo esatto: round_trip fa lo stesso col parser C (quello di default
+    # sbaglia a volte l'ultima cifra), così l'output non dipende da quale parser è installato.
+    # str_cols (nomi o posizioni) restano stringhe su entrambi i parser: pyarrow convertirebbe da solo
+    # le date ISO e il parser C no, invece le date le interpreta solo _parse_date_col.
+    if Path(path).suffix.lower() == ".parquet":
+        return pd.read_parquet(path)
     try:
-        import pandas as pd  # type: ignore
-    except ImportError as exc:  # pragma: no cover
-        raise SystemExit(
-            "Dipendenza mancante: pandas.\n"
-            "Installa con: pip install pandas\n"
-            f"Dettagli: {exc}"
-        ) from exc
-    return pd
+        import pyarrow as pa  # type: ignore
+        from pyarrow import csv as pa_csv  # type: ignore
+    except ImportError:
+        return pd.read_csv(path, float_precision="round_trip", dtype={c: str for c in str_cols})
+
+    # pd.read_csv(engine="pyarrow") non accetta column_types: stesse opzioni, ma chiamando pyarrow direttamente
+    header = pd.read_csv(path, nrows=0).columns if any(isinstance(c, int) for c in str_cols) else None
+    convert = pa_csv.ConvertOptions(
+        column_types={header[c] if isinstance(c, int) else c: pa.string() for c in str_cols},
+        null_values=[*pa_csv.ConvertOptions().null_values, "<NA>", "None"],  # i default NA di pandas
+        strings_can_be_null=True,
+    )
+    table = pa_csv.read_csv(path, convert_options=convert)
+    # colonne tutte vuote -> float64, come fa pandas
+    table = table.cast(pa.schema([f.with_type(pa.float64()) if pa.types.is_null(f.type) else f for f in table.schema]))
+    return table.to_pandas()
+
+
+def _write_table(df, path: Path) -> None:
+    if Path(path).suffix.lower() == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        # le colonne datetime le formatta il writer: niente colonna di stringhe materializzata prima
+        df.to_csv(path, index=False, date_format="%Y-%m-%d")
 
 
 def _parse_date_col(series, *, dayfirst: bool):
-    pd = _require_pandas()
-    dt = pd.to_datetime(series, errors="coerce", dayfirst=dayfirst)
+    if pd.api.types.is_datetime64_any_dtype(series):  # es. da Parquet: niente parsing da stringa
+        return series.dt.normalize()
+    if not dayfirst:
+        return pd.to_datetime(series, errors="coerce").dt.normalize()
+    # dayfirst vale per le date giorno-prima: quelle anno-prima (ISO) restano Y-m-d, non Y-d-m
+    iso = series.astype(str).str.match(r"\s*\d{4}-\d{1,2}-\d{1,2}")
+    dt = pd.to_datetime(series.mask(iso), errors="coerce", dayfirst=True)
+    if iso.any():
+        dt = dt.mask(iso, pd.to_datetime(series.where(iso), errors="coerce", format="ISO8601"))
     return dt.dt.normalize()
 
 
-def _episode_starts(dates: np.ndarray, *, gap_days: int = 1) -> np.ndarray:
+def _episode_start_mask(days: np.ndarray, groups: np.ndarray, *, gap_days: int) -> np.ndarray:
     """
-    dates: array datetime64[D] già ordinato e unico per giorno.
-    Ritorna solo gli start di episodio: primo giorno e ogni volta che il gap > gap_days.
+    days: giorni interi ordinati per (groups, days) e unici per gruppo; groups: codici gruppo allineati.
+    True sugli start di episodio: primo giorno di ogni gruppo e ogni volta che il gap > gap_days.
+    Una sola diff su tutti i gruppi insieme (il cambio di gruppo apre sempre un episodio).
     """
-    if dates.size == 0:
-        return dates
+    if days.size == 0:
+        return np.ones(0, dtype=bool)
     if gap_days < 0:
         raise ValueError("gap_days deve essere >= 0")
     if gap_days == 0:
-        return dates
-
-    diffs = (dates[1:] - dates[:-1]).astype("timedelta64[D]").astype(int)
-    mask = np.r_[True, diffs > gap_days]
-    return dates[mask]
+        return np.ones(days.size, dtype=bool)
+    return np.r_[True, (np.diff(days) > gap_days) | (groups[1:] != groups[:-1])]
 
 
 def load_event_dates(
@@ -51,13 +89,11 @@ def load_event_dates(
     date_col_events: str,
     dayfirst: bool,
 ):
-    pd = _require_pandas()
-
     frames = []
     if event_source in {"injury", "both"}:
         if injury_path is None:
             raise ValueError("injury_path è richiesto con event_source=injury/both")
-        inj = pd.read_csv(injury_path)
+        inj = _read_table(injury_path, str_cols=[date_col_events])
         if id_col_events not in inj.columns or date_col_events not in inj.columns:
             raise ValueError(
                 f"Injury CSV deve contenere {id_col_events!r} e {date_col_events!r}: {injury_path}"
@@ -70,7 +106,7 @@ def load_event_dates(
     if event_source in {"illness", "both"}:
         if illness_path is None:
             raise ValueError("illness_path è richiesto con event_source=illness/both")
-        ill = pd.read_csv(illness_path)
+        ill = _read_table(illness_path, str_cols=[date_col_events])
         if id_col_events not in ill.columns or date_col_events not in ill.columns:
             raise ValueError(
                 f"Illness CSV deve contenere {id_col_events!r} e {date_col_events!r}: {illness_path}"
@@ -98,15 +134,18 @@ def build_survival_labels(
     gap_days: int = 0,
     include_same_day: bool = False,
 ):
-    pd = _require_pandas()
-
     missing = {c for c in [id_col, date_col] if c not in df.columns}
     if missing:
         raise ValueError(f"Daily CSV senza colonne richieste: {sorted(missing)}")
 
-    df = df.copy()
-    df[id_col] = df[id_col].astype(str).str.strip()
-    df[date_col] = _parse_date_col(df[date_col], dayfirst=False)
+    # assign invece di copy(): si copiano solo le due colonne trasformate, il resto resta condiviso (CoW).
+    # player_id categorico: sort/duplicated/confronti lavorano sui codici interi, non sulle stringhe.
+    df = df.assign(
+        **{
+            id_col: pd.Categorical(df[id_col].astype(str).str.strip()),
+            date_col: _parse_date_col(df[date_col], dayfirst=False),
+        }
+    )
     if df[date_col].isna().any():
         n_bad = int(df[date_col].isna().sum())
         raise ValueError(f"Daily CSV: {n_bad} righe con date non parsabili.")
@@ -120,62 +159,68 @@ def build_survival_labels(
 
     df = df.sort_values([id_col, date_col], kind="mergesort").reset_index(drop=True)
 
-    events = events_df.copy()
-    if not {"player_id", "date"}.issubset(events.columns):
+    if not {"player_id", "date"}.issubset(events_df.columns):
         raise ValueError("events_df deve contenere colonne 'player_id' e 'date'.")
-    events["player_id"] = events["player_id"].astype(str).str.strip()
-    events["date"] = pd.to_datetime(events["date"], errors="coerce").dt.normalize()
-    events = events.dropna(subset=["player_id", "date"]).drop_duplicates(["player_id", "date"])
-
-    # Censor per player: ultima data disponibile nel daily dataframe
-    censor = df.groupby(id_col, sort=False)[date_col].max()
+    events = events_df[["player_id", "date"]].assign(
+        player_id=events_df["player_id"].astype(str).str.strip(),
+        date=_parse_date_col(events_df["date"], dayfirst=False),
+    )
+    events = events.dropna(subset=["player_id", "date"])  # i duplicati si tolgono sotto, sugli interi
+
+    days_all = df[date_col].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    codes = df[id_col].cat.codes.to_numpy()
+
+    # df è ordinato per (player, date): ogni gruppo è un blocco contiguo [starts[g], ends[g])
+    change = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.r_[0, change] if len(df) else np.empty(0, dtype=np.int64)
+    ends = np.r_[change, len(df)] if len(df) else np.empty(0, dtype=np.int64)
+    group_of_row = np.repeat(np.arange(starts.size), ends - starts)
+    # Censor per player: ultima data disponibile nel daily dataframe, cioè l'ultima riga del gruppo (df è ordinato)
+    censor_days = days_all[ends - 1]
+
+    # codice categoria -> gruppo; gli eventi di player assenti dal daily restano a -1
+    categories = df[id_col].cat.categories
+    group_of_code = np.full(len(categories) + 1, -1, dtype=np.int64)  # ultimo slot: codice -1
+    group_of_code[codes[starts]] = np.arange(starts.size)
+    ev_all_group = group_of_code[categories.get_indexer(events["player_id"])]
+    ev_all_day = events["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
 
     # Ignora eventi oltre il censor (non osservabili nei dati feature)
-    events["censor"] = events["player_id"].map(censor)
-    events = events.dropna(subset=["censor"])
-    events = events.loc[events["date"] <= events["censor"], ["player_id", "date"]]
-
-    # player_id -> start episodio
-    event_map: dict[str, np.ndarray] = {}
-    for pid, g in events.groupby("player_id", sort=False):
-        d = np.asarray(g["date"].sort_values().unique(), dtype="datetime64[D]")
-        event_map[str(pid)] = _episode_starts(d, gap_days=gap_days)
-
-    T = np.empty((len(df),), dtype=np.int64)
-    E = np.empty((len(df),), dtype=np.int64)
-
-    dates_all = df[date_col].to_numpy(dtype="datetime64[D]")
-    players_all = df[id_col].to_numpy(dtype=str)
-
-    change = np.flatnonzero(players_all[1:] != players_all[:-1]) + 1
-    starts = np.r_[0, change]
-    ends = np.r_[change, len(df)]
+    keep = ev_all_group >= 0
+    keep[keep] = ev_all_day[keep] <= censor_days[ev_all_group[keep]]
+    ev_group = ev_all_group[keep]
+    ev_day = ev_all_day[keep]
+
+    # Start di episodio di tutti i player in un'unica passata, ordinati per (gruppo, giorno).
+    # Gli eventi di load_event_dates arrivano già ordinati per (player_id, date) e le categorie seguono
+    # lo stesso ordine: basta un controllo O(n), il sort serve solo per events_df arbitrari.
+    in_order = (ev_group[1:] > ev_group[:-1]) | ((ev_group[1:] == ev_group[:-1]) & (ev_day[1:] >= ev_day[:-1]))
+    if not in_order.all():
+        order = np.lexsort((ev_day, ev_group))
+        ev_group, ev_day = ev_group[order], ev_day[order]
+    first = np.ones(ev_group.size, dtype=bool)  # una sola volta ogni (gruppo, giorno)
+    first[1:] = (ev_group[1:] != ev_group[:-1]) | (ev_day[1:] != ev_day[:-1])
+    ev_group, ev_day = ev_group[first], ev_day[first]
+    is_start = _episode_start_mask(ev_day, ev_group, gap_days=gap_days)
+    ev_group, ev_day = ev_group[is_start], ev_day[is_start]
+
+    # Eventi e righe codificati come gruppo * span + giorno: un solo searchsorted su tutte le righe.
+    base = min(days_all.min(initial=0), ev_day.min(initial=0))
+    span = max(days_all.max(initial=0), ev_day.max(initial=0)) - base + 2
+    ev_key = ev_group * span + (ev_day - base)
+    row_key = group_of_row * span + (days_all - base)
 
     side = "left" if include_same_day else "right"
+    idx = np.searchsorted(ev_key, row_key, side=side)
+    # il primo evento successivo vale solo se è dello stesso player (altrimenti è il primo del gruppo dopo)
+    has = idx < ev_key.size
+    has[has] = ev_group[idx[has]] == group_of_row[has]
 
-    for s, e in zip(starts, ends, strict=True):
-        pid = str(players_all[int(s)])
-        d = dates_all[int(s) : int(e)]
-        censor_date = d.max()
-
-        ev = event_map.get(pid)
-        if ev is None or ev.size == 0:
-            E[int(s) : int(e)] = 0
-            T[int(s) : int(e)] = (censor_date - d).astype("timedelta64[D]").astype(np.int64)
-            continue
-
-        idx = np.searchsorted(ev, d, side=side)
-        has = idx < ev.size
-
-        next_dates = np.empty_like(d)
-        next_dates[has] = ev[idx[has]]
-        next_dates[~has] = censor_date
-
-        t_event = (next_dates - d).astype("timedelta64[D]").astype(np.int64)
-        t_cens = (censor_date - d).astype("timedelta64[D]").astype(np.int64)
+    next_days = censor_days[group_of_row]
+    next_days[has] = ev_day[idx[has]]
 
-        E[int(s) : int(e)] = has.astype(np.int64)
-        T[int(s) : int(e)] = np.where(has, t_event, t_cens).astype(np.int64, copy=False)
+    T = (next_days - days_all).astype(np.int64, copy=False)
+    E = has.astype(np.int64)
 
     df["T"] = T
     df["E"] = E
@@ -196,13 +241,13 @@ def build_arg_parser() -> argparse.ArgumentParser:
         "--input",
         default="dataset/processed/objective_rolling_7d.csv",
         type=Path,
-        help="CSV input con feature (almeno player_id,date).",
+        help="CSV o Parquet input con feature (almeno player_id,date).",
     )
     parser.add_argument(
         "--output",
         default="dataset/processed/daily_rolling_7d_labeled.csv",
         type=Path,
-        help="Dove salvare il CSV con colonne T,E aggiunte.",
+        help="Dove salvare il risultato con colonne T,E aggiunte (.csv oppure .parquet).",
     )
     parser.add_argument(
         "--event-source",
@@ -258,10 +303,9 @@ def build_arg_parser() -> argparse.ArgumentParser:
 
 
 def main(argv: list[str]) -> int:
-    pd = _require_pandas()
     args = build_arg_parser().parse_args(argv)
 
-    df = pd.read_csv(args.input)
+    df = _read_table(args.input, str_cols=[args.date_col])
 
     injury_path = args.injury_csv if args.event_source in {"injury", "both"} else None
     illness_path = args.illness_csv if args.event_source in {"illness", "both"} else None
@@ -286,8 +330,7 @@ def main(argv: list[str]) -> int:
 
     output_path: Path = args.output
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    labeled[args.date_col] = pd.to_datetime(labeled[args.date_col]).dt.strftime("%Y-%m-%d")
-    labeled.to_csv(output_path, index=False)
+    _write_table(labeled, output_path)
 
     n_events = int(labeled["E"].sum())
     print(f"OK: salvato {output_path} ({labeled.shape[0]} righe, {labeled.shape[1]} colonne), E=1: {n_events}")
@@ -2,30 +2,88 @@ from __future__ import annotations
 
 import argparse
 import sys
+from functools import reduce
 from pathlib import Path
 
+try:
+    import pandas as pd  # type: ignore
+except ImportError as exc:  # pragma: no cover
+    raise SystemExit(
+        "Dipendenza mancante: pandas.\n"
+        "Installa con: pip install pandas\n"
+        f"Dettagli: {exc}"
+    ) from exc
 
-def _require_pandas():
+
+def _require_polars():
     try:
-        import pandas as pd  # type: ignore
+        import polars as pl  # type: ignore
     except ImportError as exc:  # pragma: no cover
         raise SystemExit(
-            "Dipendenza mancante: pandas.\n"
-            "Installa con: pip install pandas\n"
+            "Dipendenza mancante: polars (richiesta da --engine polars).\n"
+            "Installa con: pip install polars\n"
             f"Dettagli: {exc}"
         ) from exc
-    return pd
+    return pl
+
+
+# Formati day-first accettati per le date wellness con --engine polars (pandas li indovina con dayfirst=True).
+# Gli anni a 2 cifre vanno prima: in polars %Y accetta anche "20" e darebbe l'anno 0020.
+# Quello che resta null viene riparsato con pandas (vedi _load_wellness_wide_polars).
+_DAYFIRST_FORMATS = ("%d.%m.%y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d")
+
+
+def _read_table(path: Path, *, str_cols=()):
+    # Formato dal suffisso: .parquet (tipi e date preservati) oppure CSV.
+    # Per i CSV si usa il parser multi-thread di pyarrow se installato, altrimenti quello C di pandas.
+    # pyarrow legge i float in modo esatto: round_trip fa lo stesso col parser C (quello di default
+    # sbaglia a volte l'ultima cifra), così l'output non dipende da quale parser è installato.
+    # str_cols (nomi o posizioni) restano stringhe su entrambi i parser: pyarrow convertirebbe da solo
+    # le date ISO e il parser C no, invece le date le interpreta solo _parse_date_col.
+    if Path(path).suffix.lower() == ".parquet":
+        return pd.read_parquet(path)
+    try:
+        import pyarrow as pa  # type: ignore
+        from pyarrow import csv as pa_csv  # type: ignore
+    except ImportError:
+        return pd.read_csv(path, float_precision="round_trip", dtype={c: str for c in str_cols})
+
+    # pd.read_csv(engine="pyarrow") non accetta column_types: stesse opzioni, ma chiamando pyarrow direttamente
+    header = pd.read_csv(path, nrows=0).columns if any(isinstance(c, int) for c in str_cols) else None
+    convert = pa_csv.ConvertOptions(
+        column_types={header[c] if isinstance(c, int) else c: pa.string() for c in str_cols},
+        null_values=[*pa_csv.ConvertOptions().null_values, "<NA>", "None"],  # i default NA di pandas
+        strings_can_be_null=True,
+    )
+    table = pa_csv.read_csv(path, convert_options=convert)
+    # colonne tutte vuote -> float64, come fa pandas
+    table = table.cast(pa.schema([f.with_type(pa.float64()) if pa.types.is_null(f.type) else f for f in table.schema]))
+    return table.to_pandas()
+
+
+def _write_table(df, path: Path) -> None:
+    if Path(path).suffix.lower() == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        # le colonne datetime le formatta il writer: niente colonna di stringhe materializzata prima
+        df.to_csv(path, index=False, date_format="%Y-%m-%d")
 
 
 def _parse_date_col(series, *, dayfirst: bool):
-    pd = _require_pandas()
-    dt = pd.to_datetime(series, errors="coerce", dayfirst=dayfirst)
+    if pd.api.types.is_datetime64_any_dtype(series):  # es. da Parquet: niente parsing da stringa
+        return series.dt.normalize()
+    if not dayfirst:
+        return pd.to_datetime(series, errors="coerce").dt.normalize()
+    # dayfirst vale per le date giorno-prima: quelle anno-prima (ISO) restano Y-m-d, non Y-d-m
+    iso = series.astype(str).str.match(r"\s*\d{4}-\d{1,2}-\d{1,2}")
+    dt = pd.to_datetime(series.mask(iso), errors="coerce", dayfirst=True)
+    if iso.any():
+        dt = dt.mask(iso, pd.to_datetime(series.where(iso), errors="coerce", format="ISO8601"))
     return dt.dt.normalize()
 
 
 def load_objective_csv(path: Path):
-    pd = _require_pandas()
-    df = pd.read_csv(path)
+    df = _read_table(path, str_cols=["date"])
 
     missing = {c for c in ["player_id", "date"] if c not in df.columns}
     if missing:
@@ -47,8 +105,7 @@ def load_objective_csv(path: Path):
 
 
 def load_wellness_wide_csv(path: Path, *, value_name: str):
-    pd = _require_pandas()
-    df = pd.read_csv(path)
+    df = _read_table(path, str_cols=[0])
     if df.shape[1] < 2:
         raise SystemExit(f"Wellness CSV inatteso (meno di 2 colonne): {path}")
 
@@ -71,6 +128,123 @@ def load_wellness_wide_csv(path: Path, *, value_name: str):
     return df
 
 
+def _read_wellness_wide(path: Path, *, value_name: str):
+    # wide (index=date, colonne=player_id) con valori numerici; stessi controlli di load_wellness_wide_csv
+    df = _read_table(path, str_cols=[0])
+    if df.shape[1] < 2:
+        raise SystemExit(f"Wellness CSV inatteso (meno di 2 colonne): {path}")
+
+    date_col = df.columns[0]
+    df = df.rename(columns={date_col: "date"})
+    df.columns = [str(c).strip() for c in df.columns]
+    df["date"] = _parse_date_col(df["date"], dayfirst=True)
+    wide = df.dropna(subset=["date"]).set_index("date").apply(pd.to_numeric, errors="coerce")
+
+    # (player_id,date) duplicati = più valori non-NaN sulla stessa data (righe ripetute o colonne player ripetute)
+    counts = wide.notna().groupby(level=0).sum().T.groupby(level=0).sum()
+    dup = int((counts - 1).clip(lower=0).to_numpy().sum())
+    if dup != 0:
+        raise SystemExit(
+            f"Wellness CSV {path}: trovate {int(dup)} chiavi duplicate (player_id,date) per {value_name}."
+        )
+    # senza duplicati "veri" si possono fondere righe/colonne ripetute (al più un valore non-NaN ciascuna)
+    if not wide.index.is_unique:
+        wide = wide.groupby(level=0).first()
+    if not wide.columns.is_unique:
+        wide = wide.T.groupby(level=0).first().T
+    return wide
+
+
+def load_wellness_all(paths: dict[str, Path], *, require_all: bool = False):
+    """
+    Legge i CSV wellness wide ({metrica: path}) e li porta in long con un solo stack:
+    colonne date, player_id, <metriche...>. Tiene le chiavi con almeno una metrica
+    (require_all=True: solo quelle con tutte le metriche).
+    """
+    wides = [_read_wellness_wide(p, value_name=name) for name, p in paths.items()]
+    wide = pd.concat(wides, axis=1, keys=list(paths), names=["metric", "player_id"])
+    long = wide.stack(level="player_id", future_stack=True)
+    long = long.dropna(how="any" if require_all else "all")
+    long = long.rename_axis(index=["date", "player_id"], columns=None).reset_index()
+    return long[["date", "player_id", *paths]]
+
+
+def _load_objective_polars(path: Path):
+    pl = _require_polars()
+    df = pl.read_csv(path, infer_schema_length=None)
+
+    missing = {c for c in ["player_id", "date"] if c not in df.columns}
+    if missing:
+        raise SystemExit(f"Objective CSV senza colonne richieste: {sorted(missing)} ({path})")
+
+    df = df.with_columns(
+        pl.col("date").cast(pl.String).str.strip_chars().str.to_datetime(strict=False).dt.date().alias("date")
+    )
+    n_bad = df["date"].null_count()
+    if n_bad:
+        raise SystemExit(f"Objective CSV: {n_bad} righe con date non parsabili ({path})")
+
+    dup = df.height - df.select(pl.struct("player_id", "date").n_unique()).item()
+    if dup != 0:
+        raise SystemExit(
+            f"Objective CSV: trovate {int(dup)} chiavi duplicate (player_id,date). "
+            "Serve aggregazione prima del merge."
+        )
+    return df
+
+
+def _load_wellness_wide_polars(path: Path, *, value_name: str):
+    pl = _require_polars()
+    # tutto come stringa: le colonne player vengono poi castate a Float64 (valori non numerici -> null)
+    df = pl.read_csv(path, infer_schema=False)
+    if df.width < 2:
+        raise SystemExit(f"Wellness CSV inatteso (meno di 2 colonne): {path}")
+
+    df = df.rename({c: "date" if i == 0 else str(c).strip() for i, c in enumerate(df.columns)})
+    raw = pl.col("date").str.strip_chars()
+    parsed = pl.coalesce([raw.str.to_date(fmt, strict=False) for fmt in _DAYFIRST_FORMATS])
+    if df.select((parsed.is_null() & (raw.str.len_chars() > 0)).any()).item():
+        # formati fuori lista (es. con orario): stesso parser dell'engine pandas, così i due engine coincidono
+        dates = _parse_date_col(df["date"].to_pandas(), dayfirst=True)
+        parsed = pl.from_pandas(dates).cast(pl.Date)
+    df = (
+        df.with_columns(parsed.alias("date"))
+        .unpivot(index="date", variable_name="player_id", value_name=value_name)
+        .with_columns(pl.col(value_name).str.strip_chars().cast(pl.Float64, strict=False))
+        .drop_nulls(["date", "player_id", value_name])
+    )
+
+    dup = df.height - df.select(pl.struct("player_id", "date").n_unique()).item()
+    if dup != 0:
+        raise SystemExit(
+            f"Wellness CSV {path}: trovate {int(dup)} chiavi duplicate (player_id,date) per {value_name}."
+        )
+    return df
+
+
+def _merge_daily_polars(*, objective_path: Path, wellness_paths: dict[str, Path], how: str):
+    pl = _require_polars()
+
+    objective = _load_objective_polars(objective_path)
+    wellness = [_load_wellness_wide_polars(p, value_name=name) for name, p in wellness_paths.items()]
+
+    # tutti i join in un unico piano lazy: polars li esegue multi-thread senza copie intermedie
+    key_cols = ["player_id", "date"]
+    pl_how = {"outer": "full"}.get(how, how)
+    merged = reduce(
+        lambda left, right: left.join(right, on=key_cols, how=pl_how, coalesce=True),
+        [objective.lazy(), *(w.lazy() for w in wellness)],
+    )
+
+    objective_cols = [c for c in objective.columns if c not in key_cols]
+    merged = (
+        merged.select(key_cols + objective_cols + list(wellness_paths))
+        .sort(key_cols, maintain_order=True)
+        .collect()
+    )
+    return merged.to_pandas()
+
+
 def merge_daily(
     *,
     objective_path: Path,
@@ -79,18 +253,51 @@ def merge_daily(
     sleep_quality_path: Path,
     stress_path: Path,
     how: str,
+    engine: str = "pandas",
 ):
-    objective = load_objective_csv(objective_path)
+    if engine == "polars":
+        wellness_paths = {
+            "fatigue": fatigue_path,
+            "soreness": soreness_path,
+            "sleep_quality": sleep_quality_path,
+            "stress": stress_path,
+        }
+        return _merge_daily_polars(objective_path=objective_path, wellness_paths=wellness_paths, how=how)
+    if engine != "pandas":
+        raise ValueError(f"engine non supportato: {engine!r}")
 
-    fatigue = load_wellness_wide_csv(fatigue_path, value_name="fatigue")
-    soreness = load_wellness_wide_csv(soreness_path, value_name="soreness")
-    sleep_quality = load_wellness_wide_csv(sleep_quality_path, value_name="sleep_quality")
-    stress = load_wellness_wide_csv(stress_path, value_name="stress")
+    objective = load_objective_csv(objective_path)
 
-    merged = objective.merge(fatigue, on=["player_id", "date"], how=how)
-    merged = merged.merge(soreness, on=["player_id", "date"], how=how)
-    merged = merged.merge(sleep_quality, on=["player_id", "date"], how=how)
-    merged = merged.merge(stress, on=["player_id", "date"], how=how)
+    if how == "right":
+        # la catena di right join tiene le chiavi dell'ultimo file (stress) e le metriche precedenti solo
+        # sulle chiavi sopravvissute a ogni passo: non è esprimibile con un solo merge, resta la catena
+        fatigue = load_wellness_wide_csv(fatigue_path, value_name="fatigue")
+        soreness = load_wellness_wide_csv(soreness_path, value_name="soreness")
+        sleep_quality = load_wellness_wide_csv(sleep_quality_path, value_name="sleep_quality")
+        stress = load_wellness_wide_csv(stress_path, value_name="stress")
+
+        merged = objective.merge(fatigue, on=["player_id", "date"], how=how)
+        merged = merged.merge(soreness, on=["player_id", "date"], how=how)
+        merged = merged.merge(sleep_quality, on=["player_id", "date"], how=how)
+        merged = merged.merge(stress, on=["player_id", "date"], how=how)
+    else:
+        # left/outer: basta una metrica presente; inner: servono tutte (come i 4 inner join in catena)
+        wellness = load_wellness_all(
+            {
+                "fatigue": fatigue_path,
+                "soreness": soreness_path,
+                "sleep_quality": sleep_quality_path,
+                "stress": stress_path,
+            },
+            require_all=how == "inner",
+        )
+        if pd.api.types.is_string_dtype(objective["player_id"]) and pd.api.types.is_string_dtype(wellness["player_id"]):
+            # stesse categorie (ordinate) sui due lati: il merge e il sort finale lavorano sui codici interi
+            ids = pd.Index(objective["player_id"].unique()).union(pd.Index(wellness["player_id"].unique()))
+            pid_dtype = pd.CategoricalDtype(ids.sort_values())
+            objective = objective.assign(player_id=objective["player_id"].astype(pid_dtype))
+            wellness = wellness.assign(player_id=wellness["player_id"].astype(pid_dtype))
+        merged = objective.merge(wellness, on=["player_id", "date"], how=how)
 
     key_cols = ["player_id", "date"]
     objective_cols = [c for c in objective.columns if c not in key_cols]
@@ -98,7 +305,6 @@ def merge_daily(
     merged = merged[key_cols + objective_cols + wellness_cols]
 
     merged = merged.sort_values(["player_id", "date"], kind="mergesort").reset_index(drop=True)
-    merged["date"] = merged["date"].dt.strftime("%Y-%m-%d")
 
     return merged
 
@@ -151,11 +357,17 @@ def build_arg_parser() -> argparse.ArgumentParser:
             "Default: left (tieni solo giorni con sessione oggettiva)."
         ),
     )
+    parser.add_argument(
+        "--engine",
+        default="pandas",
+        choices=["pandas", "polars"],
+        help="Motore per lettura/melt/join: pandas (default) oppure polars (join in un unico piano lazy, CSV).",
+    )
     parser.add_argument(
         "--output",
         default="dataset/processed/daily_merged.csv",
         type=Path,
-        help="Dove salvare il CSV merged.",
+        help="Dove salvare il merged (.csv oppure .parquet).",
     )
     return parser
 
@@ -170,11 +382,12 @@ def main(argv: list[str]) -> int:
         sleep_quality_path=args.sleep_quality,
         stress_path=args.stress,
         how=args.how,
+        engine=args.engine,
     )
 
     output_path: Path = args.output
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(output_path, index=False)
+    _write_table(df, output_path)
 
     print(f"OK: salvato {output_path} ({df.shape[0]} righe, {df.shape[1]} colonne)")
     return 0
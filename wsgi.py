@@ -0,0 +1,7 @@
+from webApp.api.app import create_app
+
+# Entry point WSGI per la produzione, es.:
+#   gunicorn --preload -w $(nproc) -b 0.0.0.0:8000 wsgi:app
+# Con --preload il modello viene caricato una sola volta nel master (import di webApp.api.routes)
+# e le pagine dei pesi sono condivise copy-on-write tra i worker dopo il fork.
+app = create_app()